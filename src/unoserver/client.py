@@ -1,11 +1,16 @@
 import argparse
+import gzip
 import logging
 import os
+import socket
 import sys
+import tempfile
 import time
 
+from contextlib import ExitStack
+from http.client import HTTPConnection
 from importlib import metadata
-from xmlrpc.client import ServerProxy
+from xmlrpc.client import ServerProxy, Transport
 
 __version__ = metadata.version("unoserver")
 logger = logging.getLogger("unoserver")
@@ -23,16 +28,74 @@ DOC_TYPES = {
     "com.sun.star.script.BasicIDE",
     "com.sun.star.text.WebDocument",  # Supposedly deprecated? But still around.
 }
+# Files in here are kept in memory
+SHM_DIR = "/dev/shm" if os.path.isdir("/dev/shm") else None
+
+
+class CompressingTransport(Transport):
+    """A Transport that gzips requests larger than one network packet
+
+    Documents sent as binary data are base64 encoded, so they compress well.
+    Servers before 3.2 refuse to decompress more than 20MB, so requests are
+    only compressed up to the size that the server has said that it accepts.
+    """
+
+    encode_threshold = 1400
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        # Nothing is compressed until the server says how much it accepts
+        self.max_encode_size = 0
+
+    def send_content(self, connection, request_body):
+        if self.encode_threshold < len(request_body) <= self.max_encode_size:
+            connection.putheader("Content-Encoding", "gzip")
+            # The fastest compression level gets most of the gain
+            request_body = gzip.compress(request_body, compresslevel=1)
+
+        connection.putheader("Content-Length", str(len(request_body)))
+        connection.endheaders(request_body)
+
+
+class UnixStreamHTTPConnection(HTTPConnection):
+    """An HTTPConnection over a Unix domain socket"""
+
+    def __init__(self, socket_path, timeout=socket._GLOBAL_DEFAULT_TIMEOUT):
+        super().__init__("localhost", timeout=timeout)
+        self.socket_path = socket_path
+
+    def connect(self):
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        if self.timeout is not socket._GLOBAL_DEFAULT_TIMEOUT:
+            self.sock.settimeout(self.timeout)
+        self.sock.connect(self.socket_path)
+
+
+class UnixStreamTransport(Transport):
+    """A Transport for servers listening on a Unix domain socket"""
+
+    def __init__(self, socket_path, **kwargs):
+        super().__init__(**kwargs)
+        self.socket_path = socket_path
+
+    def make_connection(self, host):
+        if self._connection and host == self._connection[0]:
+            return self._connection[1]
+        self._connection = host, UnixStreamHTTPConnection(self.socket_path)
+        return self._connection[1]
 
 
 class UnoClient:
     """An RPC client for Unoserver"""
 
-    def __init__(self, server="127.0.0.1", port="2003", host_location="auto"):
+    def __init__(
+        self, server="127.0.0.1", port="2003", host_location="auto", shmem=False
+    ):
         self.server = server
         self.port = port
+        self.shmem = shmem
         if host_location == "auto":
-            if server in ("127.0.0.1", "localhost"):
+            if server in ("127.0.0.1", "localhost") or server.startswith("unix:"):
                 self.remote = False
             else:
                 self.remote = True
@@ -43,6 +106,20 @@ class UnoClient:
         else:
             raise RuntimeError("host_location can be 'auto', 'remote', or 'local'")
 
+    def _proxy(self):
+        """Creates a ServerProxy for the server"""
+        if self.server.startswith("unix:"):
+            return ServerProxy(
+                "http://localhost",
+                transport=UnixStreamTransport(self.server[5:]),
+                allow_none=True,
+            )
+        return ServerProxy(
+            f"http://{self.server}:{self.port}",
+            transport=CompressingTransport(),
+            allow_none=True,
+        )
+
     def _connect(self, proxy, retries=5, sleep=10):
         """Check the connection to the proxy multiple times
 
@@ -56,6 +133,9 @@ class UnoClient:
                         f"API Version mismatch. Client {__version__} uses API {API_VERSION} "
                         f"while Server {info['unoserver']} uses API {info['api']}."
                     )
+                transport = proxy("transport")
+                if isinstance(transport, CompressingTransport):
+                    transport.max_encode_size = info.get("max_gzip_request_size", 0)
                 return info
             except ConnectionError as e:
                 logger.debug(f"Error {e.strerror}, waiting...")
@@ -119,7 +199,26 @@ class UnoClient:
             if os.path.isdir(outpath):
                 raise ValueError("The outpath can not be a directory")
 
-        with ServerProxy(f"http://{self.server}:{self.port}", allow_none=True) as proxy:
+        cleanup = ExitStack()
+        shm_outpath = None
+        if self.shmem and not self.remote:
+            # Hand the data over in temporary files in shared memory, that the
+            # server reads and writes directly, instead of sending it over XMLRPC.
+            # Only servers running as the same user can access the files.
+            if indata is not None:
+                fd, inpath = tempfile.mkstemp(prefix="unoserver-", dir=SHM_DIR)
+                cleanup.callback(os.unlink, inpath)
+                with os.fdopen(fd, "wb") as infile:
+                    infile.write(indata)
+                indata = None
+            if outpath is None:
+                fd, shm_outpath = tempfile.mkstemp(
+                    prefix="unoserver-", suffix=f".{convert_to}", dir=SHM_DIR
+                )
+                cleanup.callback(os.unlink, shm_outpath)
+                os.close(fd)
+
+        with cleanup, self._proxy() as proxy:
             logger.info("Connecting.")
             logger.debug(f"Host: {self.server} Port: {self.port}")
             info = self._connect(proxy)
@@ -142,14 +241,19 @@ class UnoClient:
             result = proxy.convert(
                 inpath,
                 indata,
-                None if self.remote else outpath,
+                None if self.remote else (outpath or shm_outpath),
                 convert_to,
                 filtername,
                 filter_options,
                 update_index,
                 infiltername,
             )
-            if result is not None:
+            if shm_outpath is not None:
+                with open(shm_outpath, "rb") as outfile:
+                    result = outfile.read()
+                logger.info(f"Returning {len(result)} bytes.")
+                return result
+            elif result is not None:
                 # We got the file back over xmlrpc:
                 if outpath:
                     logger.info(f"Writing to {outpath}.")
@@ -222,7 +326,7 @@ class UnoClient:
         if newpath:
             newpath = os.path.abspath(newpath)
 
-        with ServerProxy(f"http://{self.server}:{self.port}", allow_none=True) as proxy:
+        with self._proxy() as proxy:
             logger.info("Connecting.")
             logger.debug(f"Host: {self.server} Port: {self.port}")
             self._connect(proxy)
@@ -302,7 +406,9 @@ def converter_main():
     )
     parser.set_defaults(update_index=True)
     parser.add_argument(
-        "--host", default="127.0.0.1", help="The host the server runs on"
+        "--host",
+        default="127.0.0.1",
+        help="The host the server runs on, or unix:/path/to/socket for a Unix domain socket",
     )
     parser.add_argument("--port", default="2003", help="The port used by the server")
     parser.add_argument(
@@ -315,6 +421,13 @@ def converter_main():
         "Default is auto, and it will send the file as a path if the host is 127.0.0.1 or "
         "localhost, and binary data for other hosts.",
     )
+    parser.add_argument(
+        "--shmem",
+        action="store_true",
+        help="When the server is local, pass data from stdin and to stdout through temporary "
+        "files in shared memory, instead of sending it over the network. The server must run "
+        "as the same user.",
+    )
     parser.add_argument(
         "--verbose",
         action="store_true",
@@ -338,7 +451,7 @@ def converter_main():
     if args.verbose and args.quiet:
         logger.debug("Make up your mind, yo!")
 
-    client = UnoClient(args.host, args.port, args.host_location)
+    client = UnoClient(args.host, args.port, args.host_location, args.shmem)
 
     if args.outfile == "-":
         # Set outfile to None, to get the data returned from the function,
@@ -396,7 +509,9 @@ def comparer_main():
         help="The file type/extension of the result file (ex pdf). Required when using stdout",
     )
     parser.add_argument(
-        "--host", default="127.0.0.1", help="The host the server run on"
+        "--host",
+        default="127.0.0.1",
+        help="The host the server run on, or unix:/path/to/socket for a Unix domain socket",
     )
     parser.add_argument("--port", default="2003", help="The port used by the server")
     parser.add_argument(
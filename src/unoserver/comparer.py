@@ -59,15 +59,20 @@ class UnoComparer:
     Don't use this directly, instead use the client.UnoComparer.
     """
 
-    def __init__(self, interface="127.0.0.1", port="2002"):
+    def __init__(self, interface="127.0.0.1", port="2002", connection=None):
         logger.info("Starting UnoComparer.")
 
+        # The connection can also be given as a UNO connection description,
+        # like "pipe,name=something", in which case interface and port are ignored
+        if connection is None:
+            connection = f"socket,host={interface},port={port}"
+
         self.local_context = uno.getComponentContext()
         self.resolver = self.local_context.ServiceManager.createInstanceWithContext(
             "com.sun.star.bridge.UnoUrlResolver", self.local_context
         )
         self.context = self.resolver.resolve(
-            f"uno:socket,host={interface},port={port};urp;StarOffice.ComponentContext"
+            f"uno:{connection};urp;StarOffice.ComponentContext"
         )
         self.service = self.context.ServiceManager
         self.desktop = self.service.createInstanceWithContext(
@@ -79,6 +84,20 @@ class UnoComparer:
         self.type_service = self.service.createInstanceWithContext(
             "com.sun.star.document.TypeDetection", self.context
         )
+        # The document currently being compared, so it can be cancelled
+        self._document = None
+
+    def cancel_current(self):
+        """Cancels the current comparison by disposing of the document"""
+        document = self._document
+        if document is None:
+            return
+        logger.info("Cancelling comparison.")
+        try:
+            document.dispose()
+        except Exception:
+            # The comparison might just have finished
+            logger.exception("Could not dispose of the document.")
 
     def is_comparable(self, import_type, importOrg_type):
         # List export filters. You can only search on module, iflags and eflags,
@@ -168,37 +187,40 @@ class UnoComparer:
         new_document = self.desktop.loadComponentFromURL(
             newpath, "_blank", 0, new_props
         )
-        new_type = get_doc_type(new_document)
+        # Registered before anything else is done with it, so the comparison
+        # can be cancelled, and the document is closed if anything fails
+        self._document = new_document
+        try:
+            new_type = get_doc_type(new_document)
 
-        old_props = (PropertyValue(Name="Hidden", Value=True),)
+            old_props = (PropertyValue(Name="Hidden", Value=True),)
 
-        if oldpath:
-            # TODO: Verify that inpath exists and is openable, and that outdir exists, because uno's
-            # exceptions are completely useless!
+            if oldpath:
+                # TODO: Verify that inpath exists and is openable, and that outdir exists, because uno's
+                # exceptions are completely useless!
 
-            # Load the document
-            logger.info(f"Opening file {oldpath}")
-            oldpath = uno.systemPathToFileUrl(os.path.abspath(oldpath))
-            old_props += (PropertyValue(Name="URL", Value=oldpath),)
-            # This returned None if the file was locked, I'm hoping the ReadOnly flag avoids that.
-            old_type = self.type_service.queryTypeByURL(oldpath)
+                # Load the document
+                logger.info(f"Opening file {oldpath}")
+                oldpath = uno.systemPathToFileUrl(os.path.abspath(oldpath))
+                old_props += (PropertyValue(Name="URL", Value=oldpath),)
+                # This returned None if the file was locked, I'm hoping the ReadOnly flag avoids that.
+                old_type = self.type_service.queryTypeByURL(oldpath)
 
-        elif olddata:
-            # The document content is passed in as a byte string
-            old_stream = self.service.createInstanceWithContext(
-                "com.sun.star.io.SequenceInputStream", self.context
-            )
-            old_stream.initialize((uno.ByteSequence(newdata),))
-            old_props += (PropertyValue(Name="InputStream", Value=new_stream),)
-            old_props += (PropertyValue(Name="URL", Value="private:stream"),)
-            old_type = self.type_service.queryTypeByDescriptor(old_props, False)[0]
+            elif olddata:
+                # The document content is passed in as a byte string
+                old_stream = self.service.createInstanceWithContext(
+                    "com.sun.star.io.SequenceInputStream", self.context
+                )
+                old_stream.initialize((uno.ByteSequence(newdata),))
+                old_props += (PropertyValue(Name="InputStream", Value=new_stream),)
+                old_props += (PropertyValue(Name="URL", Value="private:stream"),)
+                old_type = self.type_service.queryTypeByDescriptor(old_props, False)[0]
 
-        old_props += (PropertyValue(Name="NoAcceptDialog", Value=True),)
+            old_props += (PropertyValue(Name="NoAcceptDialog", Value=True),)
 
-        logger.info(f"Opening original file {oldpath}")
+            logger.info(f"Opening original file {oldpath}")
 
-        # Now do the comparison, then the conversion
-        try:
+            # Now do the comparison, then the conversion
             # Figure out document type of import file:
             # Figure out document type of original import file:
             # check that the two type is same
@@ -264,6 +286,7 @@ class UnoComparer:
             new_document.dispose()
 
         finally:
+            self._document = None
             new_document.close(True)
 
         if outpath is None:
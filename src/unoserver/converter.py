@@ -67,15 +67,20 @@ class UnoConverter:
     Don't use this directly, instead use the client.UnoConverter.
     """
 
-    def __init__(self, interface="127.0.0.1", port="2002"):
+    def __init__(self, interface="127.0.0.1", port="2002", connection=None):
         logger.info("Starting UnoConverter.")
 
+        # The connection can also be given as a UNO connection description,
+        # like "pipe,name=something", in which case interface and port are ignored
+        if connection is None:
+            connection = f"socket,host={interface},port={port}"
+
         self.local_context = uno.getComponentContext()
         self.resolver = self.local_context.ServiceManager.createInstanceWithContext(
             "com.sun.star.bridge.UnoUrlResolver", self.local_context
         )
         self.context = self.resolver.resolve(
-            f"uno:socket,host={interface},port={port};urp;StarOffice.ComponentContext"
+            f"uno:{connection};urp;StarOffice.ComponentContext"
         )
         self.service = self.context.ServiceManager
         self.desktop = self.service.createInstanceWithContext(
@@ -89,6 +94,20 @@ class UnoConverter:
         )
         self._export_filters = None
         self._import_filters = None
+        # The document currently being converted, so it can be cancelled
+        self._document = None
+
+    def cancel_current(self):
+        """Cancels the current conversion by disposing of the document"""
+        document = self._document
+        if document is None:
+            return
+        logger.info("Cancelling conversion.")
+        try:
+            document.dispose()
+        except Exception:
+            # The conversion might just have finished
+            logger.exception("Could not dispose of the document.")
 
     def find_filter(self, import_type, export_type):
         for export_filter in self.get_available_export_filters():
@@ -199,6 +218,17 @@ class UnoConverter:
                     f"There is no '{infiltername}' import filter. Available filters: {sorted(infilters.keys())}"
                 )
 
+        if filtername is not None:
+            # Check the export filter before loading the document, as it
+            # doesn't depend on the document, and loading it can be slow.
+            available_filter_names = self.get_filter_names(
+                self.get_available_export_filters()
+            )
+            if filtername not in available_filter_names:
+                raise RuntimeError(
+                    f"There is no '{filtername}' export-filter. Available filters: {sorted(available_filter_names)}"
+                )
+
         if inpath:
             # TODO: Verify that inpath exists and is openable, and that outdir exists, because uno's
             # exceptions are completely useless!
@@ -235,25 +265,29 @@ class UnoConverter:
             logger.error(error)
             raise RuntimeError(error)
 
-        if update_index:
-            # Update document indexes
-            for ii in range(2):
-                # At first, update Table-of-Contents.
-                # ToC grows, so page numbers grow too.
-                # On second turn, update page numbers in ToC.
-                try:
-                    document.refresh()
-                    indexes = document.getDocumentIndexes()
-                except AttributeError:
-                    # The document doesn't implement the XRefreshable and/or
-                    # XDocumentIndexesSupplier interfaces
-                    break
-                else:
-                    for i in range(0, indexes.getCount()):
-                        indexes.getByIndex(i).update()
+        # Registered right away, so the conversion can be cancelled while
+        # the indexes are updated too
+        self._document = document
 
         # Now do the conversion
         try:
+            if update_index:
+                # Update document indexes
+                for ii in range(2):
+                    # At first, update Table-of-Contents.
+                    # ToC grows, so page numbers grow too.
+                    # On second turn, update page numbers in ToC.
+                    try:
+                        document.refresh()
+                        indexes = document.getDocumentIndexes()
+                    except AttributeError:
+                        # The document doesn't implement the XRefreshable and/or
+                        # XDocumentIndexesSupplier interfaces
+                        break
+                    else:
+                        for i in range(0, indexes.getCount()):
+                            indexes.getByIndex(i).update()
+
             # Figure out document type:
             import_type = get_doc_type(document)
 
@@ -279,15 +313,7 @@ class UnoConverter:
                     f"Unknown export file type, unknown extension '{extension}'"
                 )
 
-            if filtername is not None:
-                available_filter_names = self.get_filter_names(
-                    self.get_available_export_filters()
-                )
-                if filtername not in available_filter_names:
-                    raise RuntimeError(
-                        f"There is no '{filtername}' export-filter. Available filters: {sorted(available_filter_names)}"
-                    )
-            else:
+            if filtername is None:
                 filtername = self.find_filter(import_type, export_type)
                 if filtername is None:
                     raise RuntimeError(
@@ -345,6 +371,7 @@ class UnoConverter:
             document.storeToURL(export_path, output_props)
 
         finally:
+            self._document = None
             document.close(True)
 
         if outpath is None:
@@ -1,46 +1,577 @@
 from __future__ import annotations
 
 import argparse
+import collections
+import errno
+import hashlib
 import logging
 import os
 import shutil
 import signal
 import socket
+import stat
 import subprocess
 import sys
 import tempfile
 import threading
 import time
 import platform
+import queue
+import selectors
+import xmlrpc.client
 import xmlrpc.server
 from importlib import metadata
 from pathlib import Path
 
-from concurrent import futures
+try:
+    import fcntl
+except ImportError:
+    # Windows
+    fcntl = None
 
-from unoserver import converter, comparer
+try:
+    # Optional, used on Windows to stop LibreOffice when unoserver exits
+    import win32api
+    import win32con
+    import win32job
+except ImportError:
+    win32job = None
 
 API_VERSION = "3"
 __version__ = metadata.version("unoserver")
 logger = logging.getLogger("unoserver")
 
+# How long to wait for LibreOffice and the XMLRPC server to start, in seconds
+STARTUP_TIMEOUT = 30
+# How long to wait for a timed out conversion to be cancelled, before
+# terminating LibreOffice, in seconds
+CANCEL_TIMEOUT = 2
+# How often to check that the idle LibreOffice processes are alive, in seconds
+HEALTH_CHECK_INTERVAL = 30
+# I think only --headless and --norestore are needed for
+# command line usage, but let's add everything to be safe.
+LIBREOFFICE_ARGS = (
+    "--headless",
+    "--invisible",
+    "--nocrashreport",
+    "--nodefault",
+    "--nologo",
+    "--nofirststartwizard",
+    "--norestore",
+)
+
+
+def uno_pipe_path(name):
+    """The path of the Unix socket that LibreOffice creates for a named pipe"""
+    # LibreOffice puts it in /tmp, or /var/tmp if /tmp isn't writable,
+    # with the user id in the name, so users can't connect to each other.
+    tmpdir = "/tmp" if os.access("/tmp", os.W_OK) else "/var/tmp"
+    return f"{tmpdir}/OSL_PIPE_{os.getuid()}_{name}"
+
+
+def lock_profile_cache(executable):
+    """Finds the cached LibreOffice user profile for this executable, and locks it
+
+    Creating a new user profile is a large part of the LibreOffice startup time,
+    so the profile is kept between runs, in the user's cache directory. Returns
+    the profile path and the open lock file, which must be kept open for as long
+    as the profile is used, or (None, None) if the profile can't be used, for
+    example because another unoserver is using it.
+    """
+    if fcntl is None or executable is None:
+        return None, None
+
+    # A new LibreOffice version may not like an old profile, and is installed
+    # as a new executable, so use a separate profile per executable.
+    path = shutil.which(executable) or executable
+    try:
+        path = os.path.realpath(path)
+        key = f"{path}:{os.stat(path).st_mtime_ns}"
+        cache_home = os.environ.get("XDG_CACHE_HOME") or Path.home() / ".cache"
+    except (OSError, RuntimeError):
+        return None, None
+    digest = hashlib.sha1(key.encode("utf8")).hexdigest()[:12]
+    profile = Path(cache_home) / "unoserver" / f"profile-{digest}"
+
+    try:
+        profile.mkdir(parents=True, exist_ok=True)
+        # LibreOffice has its own .lock file in the profile, so put ours next to it
+        lockfile = open(profile.with_suffix(".lock"), "w")
+    except OSError:
+        return None, None
+
+    try:
+        fcntl.flock(lockfile, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except OSError:
+        lockfile.close()
+        logger.info(f"The profile in {profile} is in use, using a temporary profile")
+        return None, None
+
+    return profile, lockfile
+
+
+class SpawnedProcess:
+    """A process started with posix_spawn
+
+    This has the parts of the subprocess.Popen API that unoserver uses. Popen
+    may fork() the Python process, which after loading uno is big enough that
+    the copy can get the server killed on memory constrained systems.
+    """
+
+    def __init__(self, args):
+        self.args = args
+        self.returncode = None
+        # Reentrant, as the signal handlers can poll while the main thread waits
+        self._lock = threading.RLock()
+        # Python ignores SIGPIPE, restore the default like Popen does.
+        setsigdef = [
+            getattr(signal, name)
+            for name in ("SIGPIPE", "SIGXFSZ")
+            if hasattr(signal, name)
+        ]
+        # Start it in a new session, so LibreOffice and the processes it starts
+        # are in their own process group.
+        self.pid = os.posix_spawnp(
+            args[0], args, os.environ, setsigdef=setsigdef, setsid=True
+        )
+
+    def _set_returncode(self, status):
+        if os.WIFSIGNALED(status):
+            self.returncode = -os.WTERMSIG(status)
+        else:
+            self.returncode = os.WEXITSTATUS(status)
+
+    def poll(self):
+        # Like Popen, don't block while another thread is reaping the process,
+        # it's still running until that's done.
+        if not self._lock.acquire(blocking=False):
+            return None
+        try:
+            if self.returncode is None:
+                try:
+                    pid, status = os.waitpid(self.pid, os.WNOHANG)
+                except ChildProcessError:
+                    # Someone else reaped it, we can't know the exit status
+                    self.returncode = 0
+                else:
+                    if pid == self.pid:
+                        self._set_returncode(status)
+            return self.returncode
+        finally:
+            self._lock.release()
+
+    def wait(self, timeout=None):
+        if timeout is None:
+            if hasattr(os, "waitid") and hasattr(os, "WNOWAIT"):
+                # Wait for it to exit without reaping it, and without holding
+                # the lock, so other threads can poll and signal it meanwhile.
+                # Not on macOS, where the lock is held, like Popen does.
+                try:
+                    os.waitid(os.P_PID, self.pid, os.WEXITED | os.WNOWAIT)
+                except ChildProcessError:
+                    # Already reaped
+                    pass
+            with self._lock:
+                if self.returncode is None:
+                    try:
+                        pid, status = os.waitpid(self.pid, 0)
+                    except ChildProcessError:
+                        # A signal handler may have reaped it while we waited
+                        if self.returncode is None:
+                            self.returncode = 0
+                    else:
+                        self._set_returncode(status)
+                return self.returncode
+
+        endtime = time.monotonic() + timeout
+        delay = 0.0005
+        while self.poll() is None:
+            remaining = endtime - time.monotonic()
+            if remaining <= 0:
+                raise subprocess.TimeoutExpired(self.args, timeout)
+            delay = min(delay * 2, remaining, 0.05)
+            time.sleep(delay)
+        return self.returncode
+
+    def send_signal(self, sig):
+        # Don't signal a process that has been reaped, the pid may be reused
+        if self.poll() is None:
+            # It's started in a new session, so the pid is also the process
+            # group id. Signal the whole group, so that the processes
+            # LibreOffice starts, like soffice.bin, don't get left behind.
+            os.killpg(self.pid, sig)
+
+    def terminate(self):
+        self.send_signal(signal.SIGTERM)
+
+    def kill(self):
+        self.send_signal(signal.SIGKILL)
+
+
+def kill_on_close_job(pid):
+    """Puts a Windows process in a job that kills it when the job is closed
+
+    The job is closed when the returned handle is, or when unoserver exits,
+    and that also kills the processes LibreOffice started, which signals don't.
+    """
+    job = win32job.CreateJobObject(None, "")
+    info = win32job.QueryInformationJobObject(
+        job, win32job.JobObjectExtendedLimitInformation
+    )
+    limits = info["BasicLimitInformation"]
+    limits["LimitFlags"] |= win32job.JOB_OBJECT_LIMIT_KILL_ON_JOB_CLOSE
+    win32job.SetInformationJobObject(
+        job, win32job.JobObjectExtendedLimitInformation, info
+    )
+    handle = win32api.OpenProcess(
+        win32con.PROCESS_TERMINATE | win32con.PROCESS_SET_QUOTA, False, pid
+    )
+    try:
+        win32job.AssignProcessToJobObject(job, handle)
+    finally:
+        win32api.CloseHandle(handle)
+    return job
+
+
+def spawn(args):
+    """Starts a process, with posix_spawn where available"""
+    if hasattr(os, "posix_spawnp"):
+        return SpawnedProcess(args)
+    process = subprocess.Popen(args, start_new_session=True)
+    if win32job is not None:
+        # Keep the job as long as the process, closing it kills the process
+        process.job = kill_on_close_job(process.pid)
+    return process
+
+
+class UnoServerPool:
+    """The LibreOffice processes that the conversions are distributed between
+
+    Each LibreOffice is identified by its index in the process list, and
+    converts one document at a time. The one that has been idle the longest
+    is used first.
+    """
+
+    def __init__(self, processes, is_listening):
+        self.processes = processes
+        # Checks if the LibreOffice with the given index accepts connections
+        self.is_listening = is_listening
+        self.members = set()
+        self.in_use = set()
+        self.ready = collections.deque()
+        self.condition = threading.Condition()
+        self.closed = False
+        self.next_health_check = time.monotonic() + HEALTH_CHECK_INTERVAL
+
+    def add(self, backend):
+        """Adds a LibreOffice that is ready to convert documents"""
+        with self.condition:
+            self.members.add(backend)
+            self.ready.append(backend)
+            self.condition.notify()
+
+    def acquire(self):
+        """Waits for a free LibreOffice and returns its index"""
+        while True:
+            with self.condition:
+                # Only one of the waiting requests runs each health check
+                check = time.monotonic() > self.next_health_check
+                if check:
+                    self.next_health_check = time.monotonic() + HEALTH_CHECK_INTERVAL
+            if check:
+                self.check_health()
+
+            with self.condition:
+                if self.ready:
+                    backend = self.ready.popleft()
+                    self.in_use.add(backend)
+                    return backend
+                if self.closed:
+                    raise RuntimeError("The server is shutting down.")
+                # Wake up for the next health check, as it may put a LibreOffice
+                # that stopped responding back in the pool.
+                self.condition.wait(self.next_health_check - time.monotonic())
+
+    def release(self, backend):
+        """Returns a LibreOffice to the pool after a conversion"""
+        with self.condition:
+            self.in_use.discard(backend)
+            self.ready.append(backend)
+            self.condition.notify()
+
+    def evict(self, backend):
+        """Takes a LibreOffice that is in use out of the pool"""
+        logger.warning(f"Removing LibreOffice {backend} from the pool.")
+        with self.condition:
+            self.in_use.discard(backend)
+            self.members.discard(backend)
+
+    def is_healthy(self, backend):
+        if self.processes[backend].poll() is not None:
+            return False
+        return self.is_listening(backend)
+
+    def check_health(self):
+        """Takes idle LibreOffice processes that don't accept connections out
+        of the pool, and puts those that accept them again back in."""
+        with self.condition:
+            self.next_health_check = time.monotonic() + HEALTH_CHECK_INTERVAL
+            idle = self.members - self.in_use
+
+        # Check outside of the lock, so conversions aren't blocked meanwhile
+        healthy = {backend for backend in idle if self.is_healthy(backend)}
+
+        with self.condition:
+            for backend in idle - healthy:
+                if backend in self.ready:
+                    logger.warning(f"LibreOffice {backend} is not responding.")
+                    self.ready.remove(backend)
+            for backend in healthy:
+                if backend not in self.ready and backend not in self.in_use:
+                    logger.info(f"LibreOffice {backend} is responding again.")
+                    self.ready.append(backend)
+            self.condition.notify_all()
+
+    def terminate(self, timeout=10):
+        """Terminates all the LibreOffice processes, and waits for them to exit"""
+        with self.condition:
+            self.closed = True
+            # Wake up the requests waiting for a LibreOffice
+            self.condition.notify_all()
+
+        # Signal them all first, so they shut down in parallel
+        running = [process for process in self.processes if process.poll() is None]
+        for process in running:
+            process.terminate()
+
+        deadline = time.monotonic() + timeout
+        for process in running:
+            try:
+                process.wait(max(deadline - time.monotonic(), 0))
+            except subprocess.TimeoutExpired:
+                logger.info("Signalling harder...")
+                process.terminate()
+
+
+class XMLRPCRequestHandler(xmlrpc.server.SimpleXMLRPCRequestHandler):
+    # Compress responses larger than one network packet, if the client accepts it
+    encode_threshold = 1400
+    # Keep the connection open between requests, so clients making several
+    # calls don't have to connect again for each one.
+    protocol_version = "HTTP/1.1"
+    # But close idle connections, as each one holds a request thread.
+    timeout = 10
+    # The superclass refuses to decompress requests to more than 20MB, which
+    # is too little for documents. But there must be a limit, or a small
+    # request could decompress to gigabytes.
+    max_decode_size = 512 * 1024 * 1024
+
+    def decode_request_content(self, data):
+        encoding = self.headers.get("content-encoding", "identity").lower()
+        if encoding != "gzip":
+            return super().decode_request_content(data)
+
+        try:
+            return xmlrpc.client.gzip_decode(data, max_decode=self.max_decode_size)
+        except ValueError:
+            self.send_response(400, "error decoding gzip content")
+            self.send_header("Content-length", "0")
+            self.end_headers()
+
+    def handle(self):
+        # Like the superclass, but waits for the next request on a connection
+        # that is kept alive in a way that lets the server close it, if it
+        # needs the thread for a new connection.
+        self.close_connection = True
+        self.handle_one_request()
+        while not self.close_connection:
+            self.server.set_idle(self.request, True)
+            try:
+                more = self.rfile.peek(1)
+            except OSError:
+                # Timed out, or closed by the server
+                more = b""
+            if not self.server.set_idle(self.request, False) or not more:
+                # Closed by the server or by the client
+                break
+            self.handle_one_request()
+
+    def setup(self):
+        # The superclass disables Nagle's algorithm, which is only possible on TCP
+        if self.server.is_unix_socket:
+            self.disable_nagle_algorithm = False
+        super().setup()
+
+    def address_string(self):
+        # Clients connecting over a Unix socket have no address
+        if self.server.is_unix_socket:
+            return self.server.server_address
+        return super().address_string()
+
 
 class XMLRPCServer(xmlrpc.server.SimpleXMLRPCServer):
+    # Requests are handled by a pool of threads, so that a long conversion
+    # doesn't block other clients, without starting a thread per connection.
+    request_threads = 32
+    # New connections wait in the listen queue while all the threads are
+    # busy. Don't drop them when many clients connect at the same time.
+    request_queue_size = 128
+
     def __init__(
         self,
         addr: tuple[str, int],
         allow_none: bool = False,
     ) -> None:
-        addr_info = socket.getaddrinfo(addr[0], addr[1], proto=socket.IPPROTO_TCP)
+        if addr[0].startswith("unix:"):
+            # Listen on a Unix domain socket, the port is ignored.
+            self.address_family = socket.AF_UNIX
+            self.socket_type = socket.SOCK_STREAM
+            address = addr[0][5:]
+            # Only remove the socket file when closing if it is ours
+            self.unix_socket_bound = False
+        else:
+            addr_info = socket.getaddrinfo(addr[0], addr[1], proto=socket.IPPROTO_TCP)
 
-        if len(addr_info) == 0:
-            raise RuntimeError(
-                f"Could not get interface information for {addr[0]}:{addr[1]}"
+            if len(addr_info) == 0:
+                raise RuntimeError(
+                    f"Could not get interface information for {addr[0]}:{addr[1]}"
+                )
+
+            self.address_family = addr_info[0][0]
+            self.socket_type = addr_info[0][1]
+            address = addr_info[0][4]
+
+        # Connections are handed to the request threads through this queue
+        self.requests = queue.SimpleQueue()
+        self.free_threads = threading.Semaphore(self.request_threads)
+        self.request_workers = []
+        # Kept alive connections that wait for their next request
+        self.idle_connections = set()
+        self.idle_lock = threading.Lock()
+        super().__init__(
+            addr=address,
+            requestHandler=XMLRPCRequestHandler,
+            allow_none=allow_none,
+            # Decode the document data straight to bytes, instead of
+            # xmlrpc.client.Binary objects that we then have to unwrap.
+            use_builtin_types=True,
+        )
+        # Daemon threads, so a client that keeps its connection open doesn't
+        # keep unoserver from exiting.
+        for number in range(self.request_threads):
+            worker = threading.Thread(
+                target=self.process_requests,
+                name=f"unoserver-http-{number}",
+                daemon=True,
             )
+            worker.start()
+            self.request_workers.append(worker)
+
+    @property
+    def is_unix_socket(self):
+        return self.address_family == getattr(socket, "AF_UNIX", None)
+
+    def server_bind(self):
+        if self.is_unix_socket:
+            # Remove the socket file left behind by a previous server, but
+            # not one that a running server is still listening on.
+            try:
+                if stat.S_ISSOCK(os.stat(self.server_address).st_mode):
+                    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+                        try:
+                            sock.connect(self.server_address)
+                        except ConnectionRefusedError:
+                            os.unlink(self.server_address)
+                        else:
+                            raise OSError(
+                                errno.EADDRINUSE,
+                                f"Another server is listening on {self.server_address}",
+                            )
+            except FileNotFoundError:
+                pass
+            super().server_bind()
+            self.unix_socket_bound = True
+            return
+
+        # SO_REUSEADDR is set by the superclass, as allow_reuse_address is True.
+        # SO_REUSEPORT also allows running several unoservers on the same port,
+        # letting the kernel distribute the connections between them.
+        if hasattr(socket, "SO_REUSEPORT"):
+            try:
+                self.socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+            except OSError:
+                # Defined, but not supported by this kernel
+                pass
+        super().server_bind()
+
+    def get_request(self):
+        # Only accept a connection when there is a thread to handle it
+        if not self.free_threads.acquire(blocking=False):
+            # Make room by closing a connection that is waiting for its next
+            # request, the client will reconnect if it has one.
+            self.close_idle_connections(1)
+            # Don't wait for long, serve_forever() must notice a shutdown()
+            if not self.free_threads.acquire(timeout=0.5):
+                # The superclass ignores this, the connection stays queued
+                raise OSError("All the request threads are busy")
+        try:
+            return super().get_request()
+        except OSError:
+            self.free_threads.release()
+            raise
 
-        self.address_family = addr_info[0][0]
-        self.socket_type = addr_info[0][1]
-        super().__init__(addr=addr_info[0][4], allow_none=allow_none)
+    def process_request(self, request, client_address):
+        self.requests.put((request, client_address))
+
+    def process_requests(self):
+        """Handles the connections in one of the request threads"""
+        while (item := self.requests.get()) is not None:
+            request, client_address = item
+            try:
+                self.finish_request(request, client_address)
+            except Exception:
+                self.handle_error(request, client_address)
+            finally:
+                self.shutdown_request(request)
+                self.free_threads.release()
+
+    def set_idle(self, request, idle):
+        """Marks a connection as waiting for its next request, or not
+
+        Returns False if the server closed the connection while it waited."""
+        with self.idle_lock:
+            if idle:
+                self.idle_connections.add(request)
+                return True
+            if request in self.idle_connections:
+                self.idle_connections.remove(request)
+                return True
+            return False
+
+    def close_idle_connections(self, count=None):
+        """Closes connections that are waiting for their next request, all by default"""
+        requests = []
+        with self.idle_lock:
+            while self.idle_connections and count != len(requests):
+                requests.append(self.idle_connections.pop())
+        for request in requests:
+            try:
+                # The request thread gets the end of the stream, and closes it
+                request.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+
+    def server_close(self):
+        super().server_close()
+        # Stop the request threads once they have finished their requests
+        for worker in self.request_workers:
+            self.requests.put(None)
+        self.close_idle_connections()
+        if self.is_unix_socket and self.unix_socket_bound:
+            try:
+                os.unlink(self.server_address)
+            except FileNotFoundError:
+                pass
 
 
 class UnoServer:
@@ -52,57 +583,116 @@ class UnoServer:
         uno_port="2002",
         user_installation=None,
         conversion_timeout=None,
+        max_parallel=None,
+        pool_size=1,
+        uno_pipe=False,
     ):
+        if pool_size < 1:
+            raise ValueError("pool_size must be at least 1")
+        if max_parallel is None:
+            # More would only wait for a free LibreOffice in the pool
+            max_parallel = pool_size
+        elif max_parallel < 1:
+            raise ValueError("max_parallel must be at least 1")
+
         self.interface = interface
         self.uno_interface = uno_interface
-        self.port = port
-        self.uno_port = uno_port
+        self.port = int(port)
+        self.uno_port = int(uno_port)
         self.user_installation = user_installation
         self.conversion_timeout = conversion_timeout
+        self.max_parallel = max_parallel
+        # LibreOffice is mostly single threaded, so there is no point in
+        # letting more conversions run at the same time than there are
+        # LibreOffice processes.
+        self.semaphore = threading.BoundedSemaphore(max_parallel)
+        # Each LibreOffice in the pool converts one document at a time.
+        self.pool_size = pool_size
+        # Connect to LibreOffice through a Unix socket instead of TCP
+        self.uno_pipe = uno_pipe
+        self.libreoffice_processes = []
+        self.pool = UnoServerPool(self.libreoffice_processes, self.uno_accepts)
         self.libreoffice_process = None
+        # File descriptors that become readable when a LibreOffice process exits
+        self.pidfds = []
+        # While wait() is running, it handles the signals
+        self.waiting = False
         self.xmlrcp_thread = None
         self.xmlrcp_server = None
         self.intentional_exit = False
 
-    def start(self, executable="libreoffice"):
-        logger.info(f"Starting unoserver {__version__}.")
+    def uno_connection(self, backend):
+        """The UNO connection description for one backend in the pool"""
+        uno_port = self.uno_port + backend
+        if self.uno_pipe:
+            # Named after the port, so several servers can use pipes
+            return f"pipe,name=unoserver-{uno_port}"
+        return f"socket,host={self.uno_interface},port={uno_port},tcpNoDelay=1"
 
-        connection = (
-            "socket,host=%s,port=%s,tcpNoDelay=1;urp;StarOffice.ComponentContext"
-            % (self.uno_interface, self.uno_port)
-        )
+    def uno_accepts(self, backend):
+        """Checks if the LibreOffice for one backend in the pool accepts connections"""
+        try:
+            if self.uno_pipe:
+                with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+                    sock.settimeout(0.2)
+                    sock.connect(uno_pipe_path(f"unoserver-{self.uno_port + backend}"))
+            else:
+                with socket.create_connection(
+                    (self.uno_interface, self.uno_port + backend), timeout=0.2
+                ):
+                    pass
+        except OSError:
+            return False
+        return True
+
+    def start_libreoffice(self, executable, backend):
+        """Starts the LibreOffice process for one backend in the pool"""
+        user_installation = self.user_installation
+        if backend > 0:
+            # LibreOffice processes can't share a user profile
+            user_installation = f"{user_installation}/{backend}"
+
+        connection = f"{self.uno_connection(backend)};urp;StarOffice.ComponentContext"
 
-        # I think only --headless and --norestore are needed for
-        # command line usage, but let's add everything to be safe.
         cmd = [
             executable,
-            "--headless",
-            "--invisible",
-            "--nocrashreport",
-            "--nodefault",
-            "--nologo",
-            "--nofirststartwizard",
-            "--norestore",
-            f"-env:UserInstallation={self.user_installation}",
+            *LIBREOFFICE_ARGS,
+            f"-env:UserInstallation={user_installation}",
             f"--accept={connection}",
         ]
 
-        logger.info("Command: " + " ".join(cmd))
-        self.libreoffice_process = subprocess.Popen(cmd)
-        self.xmlrcp_thread = threading.Thread(None, self.serve)
+        # Only join the command when it's logged, but keep it readable when it is
+        if logger.isEnabledFor(logging.INFO):
+            logger.info("Command: %s", " ".join(cmd))
+        return spawn(cmd)
 
-        def signal_handler(signum, frame):
-            self.intentional_exit = True
-            logger.info("Sending signal to LibreOffice")
+    def start(self, executable="libreoffice"):
+        logger.info(f"Starting unoserver {__version__}.")
+
+        for backend in range(self.pool_size):
+            self.libreoffice_processes.append(
+                self.start_libreoffice(executable, backend)
+            )
+        self.libreoffice_process = self.libreoffice_processes[0]
+
+        # A pidfd refers to the process itself, unlike the pid, which may be
+        # reused once the process exits. Needs Linux 5.3 and Python 3.9.
+        if hasattr(os, "pidfd_open"):
             try:
-                self.libreoffice_process.send_signal(signum)
-            except ProcessLookupError as e:
-                # 3 means the process is already dead
-                if e.errno != 3:
-                    raise
+                for process in self.libreoffice_processes:
+                    self.pidfds.append(os.pidfd_open(process.pid))
+            except OSError:
+                # Not supported by the kernel
+                for fd in self.pidfds:
+                    os.close(fd)
+                self.pidfds = []
 
-            if self.xmlrcp_server is not None:
-                self.stop()  # Ensure the server stops
+        def signal_handler(signum, frame):
+            # While waiting, the signal number is written to the wakeup fd,
+            # and wait() handles it outside of the signal handler.
+            if not self.waiting:
+                self.intentional_exit = True
+                self.forward_signal(signum)
 
         signal.signal(signal.SIGTERM, signal_handler)
         signal.signal(signal.SIGINT, signal_handler)
@@ -111,47 +701,77 @@ class UnoServer:
         if platform.system() != "Windows":
             signal.signal(signal.SIGHUP, signal_handler)
 
-        time.sleep(10)
+        # Wait for LibreOffice to start listening
+        deadline = time.monotonic() + STARTUP_TIMEOUT
+        for backend, process in enumerate(self.libreoffice_processes):
+            delay = 0.05
+            while True:
+                if process.poll() is not None:
+                    logger.info("LibreOffice exited while starting")
+                    self.stop()
+                    return None
+                if self.uno_accepts(backend):
+                    break
+                if time.monotonic() > deadline:
+                    logger.info("LibreOffice did not start listening in time")
+                    self.stop()
+                    return None
+                time.sleep(delay)
+                delay = min(delay * 2, 0.5)
 
+        self.xmlrcp_thread = threading.Thread(None, self.serve)
         self.xmlrcp_thread.start()
 
-        # Give the thread time to start
-        time.sleep(2)
-        # Check if it succeeded
-        if not self.xmlrcp_thread.is_alive():
-            logger.info("Failed to start servers")
-            self.stop()
-            return None
+        # Wait for the thread to connect to LibreOffice and start the server
+        while self.xmlrcp_server is None:
+            # Check if it succeeded
+            if not self.xmlrcp_thread.is_alive():
+                logger.info("Failed to start servers")
+                self.stop()
+                return None
+            time.sleep(0.05)
 
         return self.libreoffice_process
 
     def serve(self):
+        # These import uno, which is slow, so only do it when it's needed,
+        # and not when just running "unoserver --help", for example.
+        from unoserver import converter, comparer
+
         # Create server
-        with XMLRPCServer((self.interface, int(self.port)), allow_none=True) as server:
-            self.conv = converter.UnoConverter(
-                interface=self.uno_interface, port=self.uno_port
-            )
-            self.comp = comparer.UnoComparer(
-                interface=self.uno_interface, port=self.uno_port
-            )
+        with XMLRPCServer((self.interface, self.port), allow_none=True) as server:
+            self.converters = []
+            self.comparers = []
+            for backend in range(self.pool_size):
+                connection = self.uno_connection(backend)
+                self.converters.append(converter.UnoConverter(connection=connection))
+                self.comparers.append(comparer.UnoComparer(connection=connection))
+                self.pool.add(backend)
+            self.conv = self.converters[0]
+            self.comp = self.comparers[0]
 
-            self.xmlrcp_server = server
             server.register_introspection_functions()
+            # Allows clients to send several requests in one call with system.multicall
+            server.register_multicall_functions()
 
-            @server.register_function
-            def info():
-                import_filters = self.conv.get_filter_names(
+            # The filters don't change while LibreOffice is running, so
+            # we only need to look them up once.
+            server_info = {
+                "unoserver": __version__,
+                "api": API_VERSION,
+                # Clients can gzip requests that decompress to at most this size
+                "max_gzip_request_size": XMLRPCRequestHandler.max_decode_size,
+                "import_filters": self.conv.get_filter_names(
                     self.conv.get_available_import_filters()
-                )
-                export_filters = self.conv.get_filter_names(
+                ),
+                "export_filters": self.conv.get_filter_names(
                     self.conv.get_available_export_filters()
-                )
-                return {
-                    "unoserver": __version__,
-                    "api": API_VERSION,
-                    "import_filters": import_filters,
-                    "export_filters": export_filters,
-                }
+                ),
+            }
+
+            @server.register_function
+            def info():
+                return server_info
 
             @server.register_function
             def convert(
@@ -164,30 +784,18 @@ class UnoServer:
                 update_index=True,
                 infiltername=None,
             ):
-                if indata is not None:
-                    indata = indata.data
-
-                with futures.ThreadPoolExecutor() as executor:
-                    future = executor.submit(
-                        self.conv.convert,
-                        inpath,
-                        indata,
-                        outpath,
-                        convert_to,
-                        filtername,
-                        filter_options,
-                        update_index,
-                        infiltername,
-                    )
-                    try:
-                        return future.result(timeout=self.conversion_timeout)
-                    except futures.TimeoutError:
-                        logger.error(
-                            "Conversion timeout, terminating conversion and exiting."
-                        )
-                        self.conv.local_context.dispose()
-                        self.libreoffice_process.terminate()
-                        raise
+                return self.call_backend(
+                    self.converters,
+                    "convert",
+                    inpath,
+                    indata,
+                    outpath,
+                    convert_to,
+                    filtername,
+                    filter_options,
+                    update_index,
+                    infiltername,
+                )
 
             @server.register_function
             def compare(
@@ -198,58 +806,205 @@ class UnoServer:
                 outpath=None,
                 filetype=None,
             ):
-                if olddata is not None:
-                    olddata = olddata.data
-                if newdata is not None:
-                    newdata = newdata.data
-
-                with futures.ThreadPoolExecutor() as executor:
-                    future = executor.submit(
-                        self.comp.compare,
-                        oldpath,
-                        olddata,
-                        newpath,
-                        newdata,
-                        outpath,
-                        filetype,
-                    )
+                return self.call_backend(
+                    self.comparers,
+                    "compare",
+                    oldpath,
+                    olddata,
+                    newpath,
+                    newdata,
+                    outpath,
+                    filetype,
+                )
+
+            # start() waits for this, so only set it once nothing can fail
+            # before serve_forever(), or stop() would wait for it forever.
+            self.xmlrcp_server = server
+            server.serve_forever()
+
+    def call_backend(self, workers, method, *args):
+        """Calls a converter or comparer method with a free LibreOffice from the pool
+
+        If it doesn't finish within the conversion timeout, the document is closed,
+        and if that doesn't stop it, that LibreOffice is terminated.
+        """
+        with self.semaphore:
+            # Wait for a free LibreOffice
+            backend = self.pool.acquire()
+            worker = workers[backend]
+
+            if self.conversion_timeout is None:
                 try:
-                    return future.result(timeout=self.conversion_timeout)
-                except futures.TimeoutError:
+                    return getattr(worker, method)(*args)
+                finally:
+                    self.pool.release(backend)
+
+            lock = threading.Lock()
+            done = threading.Event()
+            timed_out = threading.Event()
+            cancelled = threading.Event()
+            terminated = threading.Event()
+
+            def terminate():
+                with lock:
+                    if terminated.is_set():
+                        return
                     logger.error(
-                        "Comparison timeout, terminating conversion and exiting."
+                        f"Could not cancel the {method}, terminating LibreOffice."
                     )
-                    self.conv.local_context.dispose()
-                    self.libreoffice_process.terminate()
+                    self.libreoffice_processes[backend].terminate()
+                    terminated.set()
+
+            def cancel():
+                try:
+                    worker.cancel_current()
+                finally:
+                    cancelled.set()
+
+            def watchdog():
+                with lock:
+                    if done.is_set():
+                        return
+                    timed_out.set()
+                logger.error(f"Timeout during {method}, cancelling it.")
+                # Closing the document blocks for as long as LibreOffice
+                # hangs, so it can't be allowed to hold up the termination.
+                threading.Thread(target=cancel, daemon=True).start()
+                if not done.wait(CANCEL_TIMEOUT):
+                    terminate()
+
+            timer = threading.Timer(self.conversion_timeout, watchdog)
+            timer.daemon = True
+            timer.start()
+            try:
+                return getattr(worker, method)(*args)
+            except Exception as e:
+                if timed_out.is_set():
+                    raise TimeoutError(
+                        f"The {method} did not finish within "
+                        f"{self.conversion_timeout} seconds."
+                    ) from e
+                raise
+            finally:
+                timer.cancel()
+                with lock:
+                    done.set()
+                # The backend can't be used for the next request until the
+                # cancel is finished, or that would close the wrong document.
+                if (
+                    timed_out.is_set()
+                    and not terminated.is_set()
+                    and not cancelled.wait(CANCEL_TIMEOUT)
+                ):
+                    terminate()
+                # A terminated LibreOffice is taken out of the pool
+                if terminated.is_set():
+                    self.pool.evict(backend)
+                else:
+                    self.pool.release(backend)
+
+    def forward_signal(self, signum):
+        """Sends a signal to LibreOffice and stops the server"""
+        logger.info("Sending signal to LibreOffice")
+        for process in self.libreoffice_processes:
+            try:
+                process.send_signal(signum)
+            except ProcessLookupError as e:
+                # 3 means the process is already dead
+                if e.errno != 3:
                     raise
 
-            server.serve_forever()
+        if self.xmlrcp_server is not None:
+            self.stop()  # Ensure the server stops
+
+    def reap(self, process, pidfd):
+        """Gets the exit status of a process that has exited"""
+        if process.returncode is None and hasattr(os, "P_PIDFD"):
+            try:
+                info = os.waitid(os.P_PIDFD, pidfd, os.WEXITED)
+            except ChildProcessError:
+                # Something else already reaped it, like a poll() in stop()
+                pass
+            else:
+                if info.si_code == os.CLD_EXITED:
+                    process.returncode = info.si_status
+                else:
+                    # Killed by a signal, returned as negative like Popen does
+                    process.returncode = -info.si_status
+        return process.wait()
+
+    def wait(self):
+        """Waits until a LibreOffice process exits, and returns that process"""
+        if not self.pidfds:
+            self.libreoffice_process.wait()
+            return self.libreoffice_process
+
+        # The selector is told which process each pidfd belongs to, so a wakeup
+        # costs the same however many LibreOffice processes there are.
+        selector = selectors.DefaultSelector()
+        for fd, process in zip(self.pidfds, self.libreoffice_processes):
+            selector.register(fd, selectors.EVENT_READ, process)
+
+        # Signals can only be handled in the main thread
+        wakeup_fd = None
+        if threading.current_thread() is threading.main_thread():
+            read_fd, write_fd = os.pipe()
+            os.set_blocking(read_fd, False)
+            os.set_blocking(write_fd, False)
+            wakeup_fd = signal.set_wakeup_fd(write_fd)
+            selector.register(read_fd, selectors.EVENT_READ)
+            self.waiting = True
+
+        try:
+            while True:
+                for key, events in selector.select():
+                    process = key.data
+                    if process is not None:
+                        self.reap(process, key.fd)
+                        return process
+                    # The wakeup fd gets one byte per signal, the signal number
+                    for signum in os.read(read_fd, 512):
+                        self.intentional_exit = True
+                        self.forward_signal(signum)
+        finally:
+            if wakeup_fd is not None:
+                self.waiting = False
+                signal.set_wakeup_fd(wakeup_fd)
+                os.close(read_fd)
+                os.close(write_fd)
+            selector.close()
+            pidfds = self.pidfds
+            self.pidfds = []
+            for fd in pidfds:
+                os.close(fd)
 
     def stop(self):
 
         if self.xmlrcp_server is not None:
             self.xmlrcp_server.shutdown()
-            # Make a dummy connection to unblock accept() - otherwise it will
-            # hang indefinitely in the accept() call.
-            # noinspection PyBroadException
+            # Stop accepting connections, so that no new clients end up
+            # queued on a socket that is about to be closed.
             try:
-                with socket.create_connection(
-                    (self.interface, int(self.port)), timeout=1
-                ):
-                    pass
-            except Exception:
-                pass  # Ignore any except
+                self.xmlrcp_server.socket.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                # Already closed, or never connected
+                pass
 
         if self.xmlrcp_thread is not None:
             self.xmlrcp_thread.join()
 
-        if self.libreoffice_process and self.libreoffice_process.poll() is not None:
-            self.libreoffice_process.terminate()
-            try:
-                self.libreoffice_process.wait(10)
-            except subprocess.TimeoutExpired:
-                logger.info("Signalling harder...")
-                self.libreoffice_process.terminate()
+        self.pool.terminate()
+
+
+def positive_int(value):
+    """An argparse type for arguments that must be at least 1"""
+    try:
+        number = int(value)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"invalid int value: {value!r}")
+    if number < 1:
+        raise argparse.ArgumentTypeError(f"must be at least 1, not {number}")
+    return number
 
 
 def main():
@@ -267,7 +1022,8 @@ def main():
     parser.add_argument(
         "--interface",
         default="127.0.0.1",
-        help="The interface used by the XMLRPC server",
+        help="The interface used by the XMLRPC server. Use unix:/path/to/socket "
+        "to listen on a Unix domain socket instead.",
     )
     parser.add_argument(
         "--uno-interface",
@@ -289,7 +1045,8 @@ def main():
     parser.add_argument(
         "--user-installation",
         default=None,
-        help="The path to the LibreOffice user profile",
+        help="The path to the LibreOffice user profile, defaults to a profile that "
+        "is kept between runs in the user's cache directory",
     )
     parser.add_argument(
         "--libreoffice-pid-file",
@@ -301,25 +1058,71 @@ def main():
     parser.add_argument(
         "--conversion-timeout",
         type=int,
-        help="Terminate Libreoffice and exit if a conversion does not complete in the "
-        "given time (in seconds).",
+        help="Cancel a conversion that does not complete in the given time (in "
+        "seconds). If it can't be cancelled, Libreoffice is terminated and "
+        "unoserver exits.",
+    )
+    parser.add_argument(
+        "--max-parallel",
+        type=positive_int,
+        default=None,
+        help="The maximum number of conversions and comparisons that are run at the "
+        "same time, defaults to the --pool-size. Further requests will wait.",
+    )
+    parser.add_argument(
+        "--pool-size",
+        type=positive_int,
+        default=1,
+        help="The number of LibreOffice processes to start. Each one converts one "
+        "document at a time, and listens on the next UNO port after the previous one. "
+        "A --max-parallel lower than this leaves some of them idle.",
+    )
+    parser.add_argument(
+        "--uno-pipe",
+        action="store_true",
+        help="Connect to LibreOffice through a named pipe instead of TCP. The pipe is "
+        "named after the UNO port, and --uno-interface is ignored. Not on Windows.",
     )
     args = parser.parse_args()
 
+    if args.uno_pipe and platform.system() == "Windows":
+        parser.error("--uno-pipe is not supported on Windows")
+
     if args.daemon:
         cmd = sys.argv
         cmd.remove("--daemon")
         proc = subprocess.Popen(cmd)
         return proc.pid
 
-    with tempfile.TemporaryDirectory() as tmpuserdir:
-        user_installation = Path(tmpuserdir).as_uri()
+    if args.executable is not None:
+        executable = args.executable
+    else:
+        # Find the executable automatically. I had problems with
+        # LibreOffice using 100% if started with the libreoffice
+        # executable, so by default try soffice first. Also throwing
+        # ooffice in there as a fallback, I don't think it's used any
+        # more, but it doesn't hurt to have it there.
+        for name in ("soffice", "libreoffice", "ooffice"):
+            if (executable := shutil.which(name)) is not None:
+                break
 
-        if args.user_installation is not None:
-            user_installation = Path(args.user_installation).as_uri()
+    profile_lock = None
+    tmpuserdir = None
+    if args.user_installation is not None:
+        user_installation = Path(args.user_installation).as_uri()
+    else:
+        profile, profile_lock = lock_profile_cache(executable)
+        if profile is None:
+            tmpuserdir = tempfile.mkdtemp(prefix="unoserver-")
+            profile = Path(tmpuserdir)
+        user_installation = profile.as_uri()
 
-        if args.uno_port == args.port:
-            raise RuntimeError("--port and --uno-port must be different")
+    try:
+        if int(args.uno_port) <= int(args.port) < int(args.uno_port) + args.pool_size:
+            raise RuntimeError(
+                "--port and --uno-port must be different, and with a --pool-size "
+                "larger than 1, --port can't be one of the following UNO ports either"
+            )
 
         server = UnoServer(
             args.interface,
@@ -328,23 +1131,14 @@ def main():
             args.uno_port,
             user_installation,
             args.conversion_timeout,
+            args.max_parallel,
+            args.pool_size,
+            args.uno_pipe,
         )
 
-        if args.executable is not None:
-            executable = args.executable
-        else:
-            # Find the executable automatically. I had problems with
-            # LibreOffice using 100% if started with the libreoffice
-            # executable, so by default try soffice first. Also throwing
-            # ooffice in there as a fallback, I don't think it's used any
-            # more, but it doesn't hurt to have it there.
-            for name in ("soffice", "libreoffice", "ooffice"):
-                if (executable := shutil.which(name)) is not None:
-                    break
-
         # If it's daemonized, this returns the process.
         # It returns 0 of getting killed in a normal way.
-        # Otherwise it returns 1 after the process exits.
+        # Otherwise it returns non-zero after the process exits.
         process = server.start(executable=executable)
         if process is None:
             return 2
@@ -354,9 +1148,12 @@ def main():
 
         if args.libreoffice_pid_file:
             with open(args.libreoffice_pid_file, "wt") as upf:
-                upf.write(f"{pid}")
+                # One PID per line, if there are several LibreOffice processes
+                upf.write("\n".join(str(p.pid) for p in server.libreoffice_processes))
 
-        process.wait()
+        # Wait for any of the LibreOffice processes to exit
+        process = server.wait()
+        pid = process.pid
 
         if not server.intentional_exit:
             logger.error(f"Looks like LibreOffice died. PID: {pid}")
@@ -367,19 +1164,23 @@ def main():
             # Remove the PID file
             os.unlink(args.libreoffice_pid_file)
 
-        try:
-            # Make sure it's really dead
-            os.kill(pid, 0)
+        if server.intentional_exit:
+            return 0
 
-            if server.intentional_exit:
-                return 0
-            else:
-                return 1
-        except OSError as e:
-            if e.errno == 3:
-                # All good, it was already dead.
-                return 0
-            raise
+        # wait() has reaped LibreOffice, so there is no need to check that it's
+        # dead. Pass on why it died, but never exit with 0, as it shouldn't have.
+        returncode = process.returncode
+        if returncode is None or returncode == 0:
+            return 1
+        if returncode < 0:
+            # Killed by a signal, exit like a shell would report it
+            return 128 - returncode
+        return returncode
+    finally:
+        if profile_lock is not None:
+            profile_lock.close()
+        if tmpuserdir is not None:
+            shutil.rmtree(tmpuserdir, ignore_errors=True)
 
 
 if __name__ == "__main__":
@@ -1,19 +1,84 @@
+import contextlib
+import os
 import pytest
-import time
+import socket
 import tempfile
 from pathlib import Path
 
-from unoserver import server
+from unoserver import client, server
+
+
+def _free_ports(count):
+    """Finds a range of free ports, and returns the first one
+
+    Nothing stops another process from taking the ports before the server
+    does, but the kernel doesn't hand out a port again right away."""
+    while True:
+        with contextlib.ExitStack() as stack:
+            sock = stack.enter_context(socket.socket())
+            sock.bind(("127.0.0.1", 0))
+            first = sock.getsockname()[1]
+            try:
+                for port in range(first + 1, first + count):
+                    sock = stack.enter_context(socket.socket())
+                    sock.bind(("127.0.0.1", port))
+            except (OSError, OverflowError):
+                # Taken, or past the last port
+                continue
+            return first
 
 
 @pytest.fixture(scope="session")
 def server_fixture():
-    with tempfile.TemporaryDirectory() as tmpuserdir:
+    # With pytest-xdist, each worker runs its own server, on its own ports and
+    # with its own profile, as one LibreOffice can't handle concurrent clients
+    # reliably. The ports are free ones, away from the ones the tests use.
+    worker = os.environ.get("PYTEST_XDIST_WORKER")
+    uno_port = _free_ports(2)
+
+    with tempfile.TemporaryDirectory(prefix=f"uno-{worker}-") as tmpuserdir:
         user_installation = Path(tmpuserdir).as_uri()
-        srvr = server.UnoServer(user_installation=user_installation)
+        srvr = server.UnoServer(
+            uno_port=uno_port, port=uno_port + 1, user_installation=user_installation
+        )
+        # start() returns when LibreOffice and the XMLRPC server accept
+        # connections, so there is no need to wait for them.
         process = srvr.start()
-        # Give libreoffice a chance to start
-        time.sleep(8)
-        yield process  # provide the fixture value
+        assert process is not None, "Unoserver failed to start"
+        yield srvr  # provide the fixture value, the tests need the port
         print("Teardown Unoserver")
         srvr.stop()
+
+
+@pytest.fixture(scope="session")
+def uno_client(server_fixture):
+    """A client for the server_fixture server, shared by the tests"""
+    return client.UnoClient(port=str(server_fixture.port))
+
+
+@pytest.fixture(scope="session")
+def server_pool_fixture():
+    """A server with a pool of LibreOffice processes, for concurrent conversions
+
+    The server hands each conversion to a free LibreOffice in the pool, so the
+    tests only need its port."""
+    worker = os.environ.get("PYTEST_XDIST_WORKER")
+    pool_size = 2
+    # The pool uses consecutive ports, and the XMLRPC server the one after
+    uno_port = _free_ports(pool_size + 1)
+    port = uno_port + pool_size
+
+    with tempfile.TemporaryDirectory(prefix=f"uno-pool-{worker}-") as tmpuserdir:
+        user_installation = Path(tmpuserdir).as_uri()
+        srvr = server.UnoServer(
+            uno_port=uno_port,
+            port=port,
+            user_installation=user_installation,
+            max_parallel=pool_size,
+            pool_size=pool_size,
+        )
+        process = srvr.start()
+        assert process is not None, "Unoserver failed to start"
+        yield srvr
+        print("Teardown pooled Unoserver")
+        srvr.stop()
@@ -0,0 +1,38 @@
+"""Unoclient unit tests"""
+from unittest import mock
+
+from unoserver import client
+
+
+def _connect(info):
+    transport = client.CompressingTransport()
+    proxy = mock.MagicMock()
+    proxy.return_value = transport
+    proxy.info.return_value = info
+    client.UnoClient(server="example.com")._connect(proxy)
+    return transport
+
+
+def _send(transport, size):
+    connection = mock.MagicMock()
+    transport.send_content(connection, b"x" * size)
+    return connection.putheader.call_args_list
+
+
+def test_compression_new_server():
+    info = {
+        "unoserver": "3.2",
+        "api": client.API_VERSION,
+        "max_gzip_request_size": 10000,
+    }
+    transport = _connect(info)
+    assert mock.call("Content-Encoding", "gzip") in _send(transport, 2000)
+    # Not larger than the server accepts
+    assert _send(transport, 20000) == [mock.call("Content-Length", "20000")]
+
+
+def test_no_compression_old_server():
+    # Older servers refuse to decompress large requests
+    info = {"unoserver": "3.1", "api": client.API_VERSION}
+    transport = _connect(info)
+    assert _send(transport, 2000) == [mock.call("Content-Length", "2000")]
@@ -1,36 +1,112 @@
 """Tests that start a real unoserver and does real things"""
 
+import contextlib
+import functools
 import io
+import itertools
 import os
 import pytest
-import re
 import socket
 import subprocess
 import sys
 import tempfile
 import time
 
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
 from xmlrpc.client import Fault
-from unoserver import client
+from unoserver import client, server
 
 
 TEST_DOCS = os.path.join(os.path.abspath(os.path.split(__file__)[0]), "documents")
 
 
-@pytest.mark.parametrize("filename", ["simple.odt", "simple.xlsx"])
-def test_pdf_conversion(server_fixture, filename):
-    infile = os.path.join(TEST_DOCS, filename)
+@functools.lru_cache(maxsize=8)
+def _load_doc(filename):
+    """Reads a test document, once per session"""
+    return Path(TEST_DOCS, filename).read_bytes()
 
-    with tempfile.NamedTemporaryFile(suffix=".pdf") as outfile:
-        # Let Libreoffice write to the file and close it.
-        sys.argv = ["unoconverter", infile, outfile.name]
-        client.converter_main()
 
-        # We now open it to check it, we can't use the outfile object,
-        # it won't reflect the external changes.
-        with open(outfile.name, "rb") as testfile:
-            start = testfile.readline()
-            assert start.startswith(b"%PDF-1.")
+def _assert_pdf_header(data):
+    """Checks that the data starts with a PDF header, of any 1.x version"""
+    assert data.startswith(b"%PDF-1."), data[:16]
+    assert data[7:8].isdigit(), data[:16]
+
+
+@pytest.fixture(scope="session", params=["simple.odt", "simple.xlsx"])
+def converted_pdf(request, server_fixture):
+    """The test documents converted to PDF, once per session
+
+    Tests that only need to check the PDF can use this, instead of
+    converting the documents again."""
+    infile = os.path.join(TEST_DOCS, request.param)
+
+    with tempfile.NamedTemporaryFile(suffix=".pdf", delete=False) as outfile:
+        pass
+    request.addfinalizer(lambda: os.unlink(outfile.name))
+
+    # Let Libreoffice write to the file and close it.
+    sys.argv = ["unoconverter", f"--port={server_fixture.port}", infile, outfile.name]
+    client.converter_main()
+    return outfile.name
+
+
+def test_pdf_conversion(converted_pdf):
+    _assert_pdf_header(Path(converted_pdf).read_bytes())
+
+
+def _wait_port(host, port, timeout=30):
+    """Waits until something accepts connections on the port
+
+    The host can also be "unix:<path>", like for the client, and then the
+    port is ignored."""
+    deadline = time.monotonic() + timeout
+    for i in itertools.count():
+        try:
+            if host.startswith("unix:"):
+                with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+                    sock.settimeout(0.2)
+                    sock.connect(host[5:])
+            else:
+                with socket.create_connection((host, port), timeout=0.2):
+                    pass
+            return
+        except OSError:
+            if time.monotonic() > deadline:
+                raise TimeoutError(f"Nothing is listening on {host}:{port}")
+            time.sleep(min(0.05 * 1.5**i, 1))
+
+
+@contextlib.contextmanager
+def _unoserver_process(*args, host="127.0.0.1", port):
+    """Runs unoserver in a subprocess, for the tests that need their own
+
+    The server is ready when its XMLRPC port answers, as that is opened once
+    LibreOffice accepts connections."""
+    # Use a temporary profile, instead of caching one in the user's home
+    with tempfile.TemporaryDirectory(prefix="uno-") as profile:
+        process = subprocess.Popen(
+            ["unoserver", f"--user-installation={profile}", *args]
+        )
+        try:
+            # Wait for it to start
+            _wait_port(host, port)
+            # Make sure the process is still running
+            assert process.poll() is None
+            yield process
+
+        finally:
+            # Now kill the process
+            process.terminate()
+            try:
+                # Wait for it to terminate
+                process.wait(30)
+            except subprocess.TimeoutExpired:
+                # Don't let it hang the test run, the assert below fails instead
+                process.kill()
+                process.wait(5)
+            # And verify that it was killed
+            assert process.returncode == 0, "unoserver did not exit cleanly"
 
 
 class FakeStdio(io.BytesIO):
@@ -41,82 +117,161 @@ class FakeStdio(io.BytesIO):
         return self
 
 
+class PipeStdio:
+    """Wraps one end of a pipe as stdin or stdout, as its binary buffer"""
+
+    def __init__(self, buffer):
+        self.buffer = buffer
+
+
+def _write_and_close(fd, data):
+    with open(fd, "wb") as outfile:
+        outfile.write(data)
+
+
 @pytest.mark.parametrize("filename", ["simple.odt", "simple.xlsx"])
 def test_stdin_stdout(server_fixture, monkeypatch, filename):
-    with open(os.path.join(TEST_DOCS, filename), "rb") as infile:
-        infile_stream = FakeStdio(infile.read())
+    # Use pipes for stdin and stdout, like in a shell pipeline. A pipe only
+    # buffers 64 KB, so threads feed stdin and collect stdout meanwhile.
+    stdin_r, stdin_w = os.pipe()
+    stdout_r, stdout_w = os.pipe()
+
+    sys.argv = [
+        "unoconverter",
+        f"--port={server_fixture.port}",
+        "-",
+        "-",
+        "--convert-to",
+        "pdf",
+    ]
+    with ThreadPoolExecutor(max_workers=2) as executor, open(
+        stdin_r, "rb"
+    ) as infile_stream, open(stdout_r, "rb") as result_stream:
+        executor.submit(_write_and_close, stdin_w, _load_doc(filename))
+        result = executor.submit(result_stream.read)
+
+        with open(stdout_w, "wb") as outfile_stream:
+            monkeypatch.setattr("sys.stdin", PipeStdio(infile_stream))
+            monkeypatch.setattr("sys.stdout", PipeStdio(outfile_stream))
+            client.converter_main()
 
-    outfile_stream = FakeStdio()
+        # Closing stdout ends the read
+        _assert_pdf_header(result.result(timeout=10))
 
-    monkeypatch.setattr("sys.stdin", infile_stream)
-    monkeypatch.setattr("sys.stdout", outfile_stream)
 
-    sys.argv = ["unoconverter", "-", "-", "--convert-to", "pdf"]
-    client.converter_main()
+@pytest.mark.parametrize("filename", ["simple.odt", "simple.xlsx"])
+def test_shmem(server_fixture, filename):
+    conv = client.UnoClient(port=str(server_fixture.port), shmem=True)
+    result = conv.convert(indata=_load_doc(filename), convert_to="pdf")
 
-    outfile_stream.seek(0)
-    start = outfile_stream.readline()
-    assert start.startswith(b"%PDF-1.")
+    _assert_pdf_header(result)
 
 
-def test_csv_conversion(server_fixture):
-    conv = client.UnoClient()
+def test_concurrent_conversions(server_pool_fixture, monkeypatch):
+    conv = client.UnoClient(port=str(server_pool_fixture.port))
+    filenames = ["simple.odt", "simple.xlsx"] * server_pool_fixture.pool_size
+
+    # Record which LibreOffices are used, and how many at the same time
+    pool = server_pool_fixture.pool
+    acquire = pool.acquire
+    used = []
+    busy = []
+
+    def recording_acquire():
+        backend = acquire()
+        used.append(backend)
+        busy.append(len(pool.in_use))
+        return backend
+
+    monkeypatch.setattr(pool, "acquire", recording_acquire)
+
+    def convert(filename):
+        return conv.convert(indata=_load_doc(filename), convert_to="pdf")
+
+    # Each LibreOffice in the pool takes one of the conversions
+    with ThreadPoolExecutor(max_workers=len(filenames)) as executor:
+        for result in executor.map(convert, filenames):
+            _assert_pdf_header(result)
+
+    assert set(used) == set(range(server_pool_fixture.pool_size))
+    # And they really converted at the same time
+    assert max(busy) == server_pool_fixture.pool_size
+
+
+def test_csv_conversion(uno_client):
     infile = os.path.join(TEST_DOCS, "simple.xlsx")
 
-    with tempfile.NamedTemporaryFile(suffix=".csv") as outfile:
-        # Let Libreoffice write to the file and close it.
-        conv.convert(inpath=infile, outpath=outfile.name)
-        # We now open it to check it, we can't use the outfile object,
-        # it won't reflect the external changes.
-        with open(outfile.name, "rb") as testfile:
-            contents = testfile.readline()
-            assert contents == b"This,Is,A,Simple,Excel,File\n"
-            contents = testfile.readline()
-            assert contents == b"1,2,3,4,5,6\n"
+    # Without an outpath, the result is returned instead of written to disk
+    result = uno_client.convert(inpath=infile, convert_to="csv")
+    assert result.splitlines(keepends=True)[:2] == [
+        b"This,Is,A,Simple,Excel,File\n",
+        b"1,2,3,4,5,6\n",
+    ]
 
 
-def test_impossible_conversion(server_fixture):
-    conv = client.UnoClient()
+def test_impossible_conversion(uno_client):
     infile = os.path.join(TEST_DOCS, "simple.odt")
 
     with tempfile.NamedTemporaryFile(suffix=".xls") as outfile:
         # Let Libreoffice write to the file and close it.
         with pytest.raises(Fault) as e:
-            conv.convert(inpath=infile, outpath=outfile.name)
+            uno_client.convert(inpath=infile, outpath=outfile.name)
             assert "Could not find an export filter" in e
 
 
 def test_multiple_servers(server_fixture):
     # The server fixture should already have started a server.
     # Make sure we can start a second one.
-    cmd = ["unoserver", "--uno-port=2102", "--port=2103"]
-    process = subprocess.Popen(cmd)
-    try:
-        # Wait for it to start
-        time.sleep(5)
-        # Make sure the process is still running, meaning return_code is None
-        assert process.returncode is None
-
+    with _unoserver_process("--uno-port=2102", "--port=2103", port=2103):
         # Make a conversion
         conv = client.UnoClient(port="2103")
         infile = os.path.join(TEST_DOCS, "simple.odt")
         with tempfile.NamedTemporaryFile(suffix=".pdf") as outfile:
             conv.convert(inpath=infile, outpath=outfile.name)
 
-    finally:
-        # Now kill the process
-        process.terminate()
-        # Wait for it to terminate
-        process.wait(30)
-        # And verify that it was killed
-        assert process.returncode == 0
+
+def test_unix_socket(server_fixture):
+    with tempfile.TemporaryDirectory() as tmpdir:
+        socket_path = os.path.join(tmpdir, "unoserver.sock")
+        with _unoserver_process(
+            "--uno-port=2106",
+            f"--interface=unix:{socket_path}",
+            host=f"unix:{socket_path}",
+            port=None,
+        ):
+            # Make a conversion
+            conv = client.UnoClient(f"unix:{socket_path}")
+            infile = os.path.join(TEST_DOCS, "simple.odt")
+            result = conv.convert(inpath=infile, convert_to="pdf")
+            _assert_pdf_header(result)
+
+        # The socket file is removed when the server stops
+        assert not os.path.exists(socket_path)
+
+
+@pytest.mark.skipif(sys.platform == "win32", reason="Named pipes are Unix sockets")
+def test_uno_pipe():
+    with _unoserver_process("--uno-port=2108", "--port=2109", "--uno-pipe", port=2109):
+        # LibreOffice created its pipe where unoserver looks for it
+        assert os.path.exists(server.uno_pipe_path("unoserver-2108"))
+
+        # Make a conversion
+        conv = client.UnoClient(port="2109")
+        infile = os.path.join(TEST_DOCS, "simple.odt")
+        result = conv.convert(inpath=infile, convert_to="pdf")
+        _assert_pdf_header(result)
 
 
 def test_unknown_outfile_type(server_fixture):
     infile = os.path.join(TEST_DOCS, "simple.odt")
 
     with tempfile.NamedTemporaryFile(suffix=".bog") as outfile:
-        sys.argv = ["unoconverter", infile, outfile.name]
+        sys.argv = [
+            "unoconverter",
+            f"--port={server_fixture.port}",
+            infile,
+            outfile.name,
+        ]
         # Type detection should fail, as it's not a .doc file:
         with pytest.raises(Fault) as e:
             client.converter_main()
@@ -131,6 +286,7 @@ def test_explicit_export_filter(server_fixture, filename):
     with tempfile.NamedTemporaryFile(suffix=".csv") as outfile:
         sys.argv = [
             "unoconverter",
+            f"--port={server_fixture.port}",
             "--filter",
             "writer_pdf_Export",
             infile,
@@ -138,69 +294,102 @@ def test_explicit_export_filter(server_fixture, filename):
         ]
         client.converter_main()
 
-        # We now open it to check it, we can't use the outfile object,
+        # We now read it to check it, we can't use the outfile object,
         # it won't reflect the external changes.
-        with open(outfile.name, "rb") as testfile:
-            start = testfile.readline()
-            assert start.startswith(b"%PDF-1.")
+        _assert_pdf_header(Path(outfile.name).read_bytes())
 
 
 @pytest.mark.parametrize("filename", ["simple.odt", "simple.xlsx"])
 def test_invalid_explicit_export_filter_prints_available_filters(
-    caplog, server_fixture, filename
+    caplog, tmp_path, server_fixture, filename
 ):
     infile = os.path.join(TEST_DOCS, filename)
-
     # We use an extension that's not .pdf to verify that the converter does not auto-detect filter based on extension
-    with tempfile.NamedTemporaryFile(suffix=".csv") as outfile:
-        sys.argv = ["unoconverter", "--filter", "asdasdasd", infile, outfile.name]
-        try:
-            client.converter_main()
-        except RuntimeError:
-            errstr = caplog.text
-            print(errstr)
-            print("=" * 30)
-            assert "Office Open XML Text" in errstr
-            assert "writer8" in errstr
-            assert "writer_pdf_Export" in errstr
-
-
-def test_update_index(server_fixture):
+    outfile = tmp_path / "out.csv"
+
+    sys.argv = [
+        "unoconverter",
+        f"--port={server_fixture.port}",
+        "--filter",
+        "asdasdasd",
+        infile,
+        str(outfile),
+    ]
+    # The client checks the filter against the server's list before converting
+    with pytest.raises(RuntimeError):
+        client.converter_main()
+    errstr = caplog.text
+    assert "Unknown export filter: asdasdasd" in errstr
+    assert "Office Open XML Text" in errstr
+    assert "writer8" in errstr
+    assert "writer_pdf_Export" in errstr
+    assert not outfile.exists()
+
+
+def test_invalid_explicit_export_filter_on_server(uno_client):
+    # Clients that don't check the filter first get an error before the
+    # document is loaded
+    with pytest.raises(Fault) as e:
+        with uno_client._proxy() as proxy:
+            proxy.convert(
+                os.path.join(TEST_DOCS, "simple.odt"),
+                None,
+                None,
+                "csv",
+                "asdasdasd",
+                [],
+                True,
+                None,
+            )
+    assert "There is no 'asdasdasd' export-filter" in e.value.faultString
+    assert "writer_pdf_Export" in e.value.faultString
+
+
+def test_update_index(server_fixture, monkeypatch):
     infile = os.path.join(TEST_DOCS, "index-with-fields.odt")
 
-    with tempfile.NamedTemporaryFile(suffix=".rtf") as outfile:
-        # Let Libreoffice write to the file and close it.
-        sys.argv = ["unoconverter", infile, outfile.name]
-        client.converter_main()
+    # Write the result to stdout, so it can be checked without a file
+    outfile_stream = FakeStdio()
+    monkeypatch.setattr("sys.stdout", outfile_stream)
+    sys.argv = [
+        "unoconverter",
+        f"--port={server_fixture.port}",
+        "--convert-to",
+        "rtf",
+        infile,
+        "-",
+    ]
+    client.converter_main()
 
-        # We now open it to check it, we can't use the outfile object,
-        # it won't reflect the external changes.
-        with open(outfile.name, "rb") as testfile:
-            # The timestamp in Header 2 should appear exactly twice after update
-            matches = re.findall(b"13:18:27", testfile.read())
-            assert len(matches) == 2
-
-        with tempfile.NamedTemporaryFile(suffix=".rtf") as outfile:
-            # Let Libreoffice write to the file and close it.
-            sys.argv = ["unoconverter", "--dont-update-index", infile, outfile.name]
-            client.converter_main()
+    # The timestamp in Header 2 should appear exactly twice after update
+    assert outfile_stream.getvalue().count(b"13:18:27") == 2
 
-            with open(outfile.name, "rb") as testfile:
-                # The timestamp in Header 2 should appear exactly once
-                matches = re.findall(b"13:18:27", testfile.read())
-                assert len(matches) == 1
+    outfile_stream = FakeStdio()
+    monkeypatch.setattr("sys.stdout", outfile_stream)
+    sys.argv = [
+        "unoconverter",
+        f"--port={server_fixture.port}",
+        "--dont-update-index",
+        "--convert-to",
+        "rtf",
+        infile,
+        "-",
+    ]
+    client.converter_main()
+
+    # The timestamp in Header 2 should appear exactly once
+    assert outfile_stream.getvalue().count(b"13:18:27") == 1
 
 
 def test_convert_not_local():
     hostname = socket.gethostname()
-    cmd = ["unoserver", "--uno-port=2104", "--port=2105", f"--interface={hostname}"]
-    process = subprocess.Popen(cmd)
-    try:
-        # Wait for it to start
-        time.sleep(5)
-        # Make sure the process is still running, meaning return_code is None
-        assert process.returncode is None
-
+    with _unoserver_process(
+        "--uno-port=2104",
+        "--port=2105",
+        f"--interface={hostname}",
+        host=hostname,
+        port=2105,
+    ):
         # Make a conversion
         infile = os.path.join(TEST_DOCS, "simple.odt")
         with tempfile.NamedTemporaryFile(suffix=".pdf") as outfile:
@@ -214,30 +403,19 @@ def test_convert_not_local():
             ]
             client.converter_main()
 
-            with open(outfile.name, "rb") as testfile:
-                start = testfile.readline()
-                assert start.startswith(b"%PDF-1.")
-
-    finally:
-        # Now kill the process
-        process.terminate()
-        # Wait for it to terminate
-        process.wait(30)
-        # And verify that it was killed
-        assert process.returncode == 0
+            _assert_pdf_header(Path(outfile.name).read_bytes())
 
 
 # This currently does not work on Ubuntu 20.04.
 def skip_test_compare_not_local():
     hostname = socket.gethostname()
-    cmd = ["unoserver", "--uno-port=2104", "--port=2105", f"--interface={hostname}"]
-    process = subprocess.Popen(cmd)
-    try:
-        # Wait for it to start
-        time.sleep(5)
-        # Make sure the process is still running, meaning return_code is None
-        assert process.returncode is None
-
+    with _unoserver_process(
+        "--uno-port=2104",
+        "--port=2105",
+        f"--interface={hostname}",
+        host=hostname,
+        port=2105,
+    ):
         # Make a comparison
         infile1 = os.path.join(TEST_DOCS, "simple.odt")
         infile2 = os.path.join(TEST_DOCS, "index-with-fields.odt")
@@ -254,14 +432,4 @@ def skip_test_compare_not_local():
             ]
             client.comparer_main()
 
-            with open(outfile.name, "rb") as testfile:
-                start = testfile.readline()
-                assert start.startswith(b"%PDF-1.")
-
-    finally:
-        # Now kill the process
-        process.terminate()
-        # Wait for it to terminate
-        process.wait(30)
-        # And verify that it was killed
-        assert process.returncode == 0
+            _assert_pdf_header(Path(outfile.name).read_bytes())
@@ -1,5 +1,15 @@
 """Unoserver unit tests"""
+import argparse
+import errno
+import gzip
 import os
+import pytest
+import signal
+import socket
+import sys
+import threading
+import time
+import xmlrpc.client
 
 from unittest import mock
 from unoserver import server
@@ -7,12 +17,20 @@ from unoserver import server
 TEST_DOCS = os.path.join(os.path.abspath(os.path.split(__file__)[0]), "documents")
 
 
+@mock.patch("time.sleep")
+@mock.patch("os.pidfd_open", create=True)
+@mock.patch("socket.create_connection")
 @mock.patch("threading.Thread")
-@mock.patch("subprocess.Popen")
-def test_server_params(popen_mock, thread_mock):
+@mock.patch("unoserver.server.spawn")
+def test_server_params(
+    spawn_mock, thread_mock, connection_mock, pidfd_mock, sleep_mock
+):
+    # LibreOffice is running, but the XMLRPC thread is not, so start() returns early
+    spawn_mock.return_value.poll.return_value = None
+    thread_mock.return_value.is_alive.return_value = False
     srv = server.UnoServer(port="2203", uno_port="2202")
     srv.start()
-    popen_mock.assert_called_with(
+    spawn_mock.assert_called_with(
         [
             "libreoffice",
             "--headless",
@@ -28,12 +46,20 @@ def test_server_params(popen_mock, thread_mock):
     )
 
 
+@mock.patch("time.sleep")
+@mock.patch("os.pidfd_open", create=True)
+@mock.patch("socket.create_connection")
 @mock.patch("threading.Thread")
-@mock.patch("subprocess.Popen")
-def test_server_ipv6_params(popen_mock, thread_mock):
+@mock.patch("unoserver.server.spawn")
+def test_server_ipv6_params(
+    spawn_mock, thread_mock, connection_mock, pidfd_mock, sleep_mock
+):
+    # LibreOffice is running, but the XMLRPC thread is not, so start() returns early
+    spawn_mock.return_value.poll.return_value = None
+    thread_mock.return_value.is_alive.return_value = False
     srv = server.UnoServer(interface="::", port="2203", uno_port="2202")
     srv.start()
-    popen_mock.assert_called_with(
+    spawn_mock.assert_called_with(
         [
             "libreoffice",
             "--headless",
@@ -47,3 +73,412 @@ def test_server_ipv6_params(popen_mock, thread_mock):
             "--accept=socket,host=127.0.0.1,port=2202,tcpNoDelay=1;urp;StarOffice.ComponentContext",
         ]
     )
+
+
+@mock.patch("time.sleep")
+@mock.patch("os.pidfd_open", create=True)
+@mock.patch("socket.create_connection")
+@mock.patch("threading.Thread")
+@mock.patch("unoserver.server.spawn")
+def test_server_pool_params(
+    spawn_mock, thread_mock, connection_mock, pidfd_mock, sleep_mock
+):
+    # LibreOffice is running, but the XMLRPC thread is not, so start() returns early
+    spawn_mock.return_value.poll.return_value = None
+    thread_mock.return_value.is_alive.return_value = False
+    srv = server.UnoServer(
+        port="2203", uno_port="2204", user_installation="file:///tmp/uno", pool_size=2
+    )
+    srv.start()
+    assert spawn_mock.call_count == 2
+    # Each LibreOffice gets its own port and user profile
+    assert spawn_mock.call_args_list[0][0][0][-2:] == [
+        "-env:UserInstallation=file:///tmp/uno",
+        "--accept=socket,host=127.0.0.1,port=2204,tcpNoDelay=1;urp;StarOffice.ComponentContext",
+    ]
+    assert spawn_mock.call_args_list[1][0][0][-2:] == [
+        "-env:UserInstallation=file:///tmp/uno/1",
+        "--accept=socket,host=127.0.0.1,port=2205,tcpNoDelay=1;urp;StarOffice.ComponentContext",
+    ]
+
+
+@mock.patch("time.sleep")
+@mock.patch("unoserver.server.UnoServer.uno_accepts")
+@mock.patch("os.pidfd_open", create=True)
+@mock.patch("threading.Thread")
+@mock.patch("unoserver.server.spawn")
+def test_server_pipe_params(
+    spawn_mock, thread_mock, pidfd_mock, accepts_mock, sleep_mock
+):
+    # LibreOffice is running, but the XMLRPC thread is not, so start() returns early
+    spawn_mock.return_value.poll.return_value = None
+    thread_mock.return_value.is_alive.return_value = False
+    srv = server.UnoServer(port="2203", uno_port="2202", uno_pipe=True)
+    srv.start()
+    accepts_mock.assert_called_with(0)
+    assert spawn_mock.call_args[0][0][-1] == (
+        "--accept=pipe,name=unoserver-2202;urp;StarOffice.ComponentContext"
+    )
+
+
+def test_unix_socket_in_use(tmp_path):
+    socket_path = str(tmp_path / "unoserver.sock")
+    with server.XMLRPCServer((f"unix:{socket_path}", 0)):
+        # A second server must not take over the socket of a running one
+        with pytest.raises(OSError) as e:
+            server.XMLRPCServer((f"unix:{socket_path}", 0))
+        assert e.value.errno == errno.EADDRINUSE
+        assert os.path.exists(socket_path)
+
+    # A socket file left behind by a server that is gone is replaced
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+        sock.bind(socket_path)
+    with server.XMLRPCServer((f"unix:{socket_path}", 0)):
+        assert os.path.exists(socket_path)
+    assert not os.path.exists(socket_path)
+
+
+def test_pool_size_and_max_parallel():
+    # By default, as many conversions run at once as there are LibreOffices
+    srv = server.UnoServer(pool_size=3)
+    assert srv.max_parallel == 3
+    srv = server.UnoServer(pool_size=3, max_parallel=1)
+    assert srv.max_parallel == 1
+
+    with pytest.raises(ValueError):
+        server.UnoServer(pool_size=0)
+    with pytest.raises(ValueError):
+        server.UnoServer(max_parallel=0)
+
+    assert server.positive_int("2") == 2
+    for value in ("0", "-1", "two"):
+        with pytest.raises(argparse.ArgumentTypeError):
+            server.positive_int(value)
+
+
+class BlockingWorker:
+    """A converter whose conversions block until they are cancelled"""
+
+    def __init__(self, cancellable=True, cancel_hangs=False):
+        self.cancellable = cancellable
+        self.cancel_hangs = cancel_hangs
+        self.cancelled = threading.Event()
+        self.stopped = threading.Event()
+        self.unhang = threading.Event()
+
+    def convert(self, *args):
+        if not self.stopped.wait(10):
+            raise AssertionError("The conversion was never stopped")
+        raise RuntimeError("The document was disposed")
+
+    def cancel_current(self):
+        self.cancelled.set()
+        if self.cancel_hangs:
+            # Like disposing a document in a LibreOffice that has hung
+            self.unhang.wait(10)
+        if self.cancellable:
+            self.stopped.set()
+
+
+def _timeout_server(worker):
+    srv = server.UnoServer(conversion_timeout=0.1)
+    process = mock.MagicMock()
+    # Terminating LibreOffice ends the conversion, even if cancelling didn't
+    process.terminate.side_effect = worker.stopped.set
+    srv.libreoffice_processes.append(process)
+    srv.pool.add(0)
+    return srv, process
+
+
+def test_conversion_timeout_cancels():
+    worker = BlockingWorker()
+    srv, process = _timeout_server(worker)
+    with pytest.raises(TimeoutError):
+        srv.call_backend([worker], "convert")
+    assert worker.cancelled.is_set()
+    process.terminate.assert_not_called()
+    # The LibreOffice is still usable
+    assert list(srv.pool.ready) == [0]
+
+
+@mock.patch("unoserver.server.CANCEL_TIMEOUT", 0.1)
+def test_conversion_timeout_terminates():
+    worker = BlockingWorker(cancellable=False)
+    srv, process = _timeout_server(worker)
+    with pytest.raises(TimeoutError):
+        srv.call_backend([worker], "convert")
+    assert worker.cancelled.is_set()
+    process.terminate.assert_called_once_with()
+    # The terminated LibreOffice is taken out of the pool
+    assert list(srv.pool.ready) == []
+    assert srv.pool.in_use == set()
+
+
+@mock.patch("unoserver.server.CANCEL_TIMEOUT", 0.1)
+def test_conversion_timeout_cancel_hangs():
+    worker = BlockingWorker(cancellable=False, cancel_hangs=True)
+    srv, process = _timeout_server(worker)
+    try:
+        with pytest.raises(TimeoutError):
+            srv.call_backend([worker], "convert")
+        process.terminate.assert_called_once_with()
+        assert list(srv.pool.ready) == []
+    finally:
+        worker.unhang.set()
+
+
+def test_conversion_within_timeout():
+    worker = mock.MagicMock()
+    worker.convert.return_value = b"result"
+    srv, process = _timeout_server(worker)
+    assert srv.call_backend([worker], "convert") == b"result"
+    # The timer is stopped when the conversion finishes
+    time.sleep(0.2)
+    worker.cancel_current.assert_not_called()
+    assert list(srv.pool.ready) == [0]
+
+
+@pytest.mark.skipif(not hasattr(os, "posix_spawnp"), reason="Needs posix_spawn")
+def test_spawned_process_poll_while_waiting():
+    process = server.SpawnedProcess(["sleep", "10"])
+    waiter = threading.Thread(target=process.wait)
+    waiter.start()
+    try:
+        time.sleep(0.1)
+        # Polling and signalling from another thread must not wait for wait()
+        start = time.monotonic()
+        assert process.poll() is None
+        process.terminate()
+        assert time.monotonic() - start < 1
+        waiter.join(5)
+        assert not waiter.is_alive()
+        assert process.returncode == -signal.SIGTERM
+    finally:
+        if process.poll() is None:
+            process.kill()
+            process.wait()
+
+
+def _pool(size, is_listening=lambda backend: True):
+    processes = [mock.MagicMock() for backend in range(size)]
+    for process in processes:
+        process.poll.return_value = None
+    pool = server.UnoServerPool(processes, is_listening)
+    for backend in range(size):
+        pool.add(backend)
+    return pool, processes
+
+
+def test_pool_acquire_release():
+    pool, processes = _pool(2)
+    assert pool.acquire() == 0
+    assert pool.acquire() == 1
+    pool.release(1)
+    pool.release(0)
+    # The one that has been idle the longest is used first
+    assert pool.acquire() == 1
+    assert pool.in_use == {1}
+
+
+def test_pool_evict():
+    pool, processes = _pool(2)
+    assert pool.acquire() == 0
+    pool.evict(0)
+    assert pool.in_use == set()
+    assert list(pool.ready) == [1]
+    # A terminated LibreOffice doesn't come back, even if it hasn't exited
+    pool.check_health()
+    assert list(pool.ready) == [1]
+
+
+def test_pool_check_health():
+    listening = {0: True, 1: False}
+    pool, processes = _pool(2, listening.get)
+    pool.check_health()
+    assert list(pool.ready) == [0]
+    # One that is in use is not checked, or put back
+    assert pool.acquire() == 0
+    listening[1] = True
+    pool.check_health()
+    assert list(pool.ready) == [1]
+    assert pool.in_use == {0}
+
+
+@mock.patch("unoserver.server.HEALTH_CHECK_INTERVAL", 0.1)
+def test_pool_recovers_after_missed_check():
+    # The only LibreOffice misses one health check, and answers again after
+    probes = []
+
+    def is_listening(backend):
+        probes.append(backend)
+        return len(probes) > 1
+
+    pool, processes = _pool(1, is_listening)
+    pool.next_health_check = 0
+
+    def convert():
+        pool.release(pool.acquire())
+
+    threads = [threading.Thread(target=convert, daemon=True) for i in range(5)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(5)
+    assert not any(thread.is_alive() for thread in threads)
+    assert len(probes) > 1
+
+
+def test_pool_closed():
+    pool, processes = _pool(1)
+    assert pool.acquire() == 0
+    pool.terminate()
+    processes[0].terminate.assert_called_once_with()
+    with pytest.raises(RuntimeError):
+        pool.acquire()
+
+
+@pytest.mark.skipif(server.fcntl is None, reason="Needs fcntl")
+def test_lock_profile_cache(tmp_path):
+    executable = tmp_path / "soffice"
+    executable.write_text("")
+    cache_home = tmp_path / "cache"
+
+    with mock.patch.dict(os.environ, {"XDG_CACHE_HOME": str(cache_home)}):
+        profile, lockfile = server.lock_profile_cache(str(executable))
+        try:
+            assert profile.parent == cache_home / "unoserver"
+            assert profile.is_dir()
+
+            # Another unoserver can't use the same profile at the same time
+            assert server.lock_profile_cache(str(executable)) == (None, None)
+        finally:
+            lockfile.close()
+
+        # But it can once the first one is done with it
+        again, lockfile = server.lock_profile_cache(str(executable))
+        lockfile.close()
+        assert again == profile
+
+        # A new LibreOffice version gets a new profile
+        mtime = executable.stat().st_mtime_ns + 1_000_000_000
+        os.utime(executable, ns=(mtime, mtime))
+        upgraded, lockfile = server.lock_profile_cache(str(executable))
+        lockfile.close()
+        assert upgraded.parent == profile.parent
+        assert upgraded != profile
+
+
+@pytest.mark.skipif(server.fcntl is None, reason="Needs fcntl")
+def test_lock_profile_cache_locked_elsewhere(tmp_path):
+    executable = tmp_path / "soffice"
+    executable.write_text("")
+
+    with mock.patch.dict(os.environ, {"XDG_CACHE_HOME": str(tmp_path)}):
+        profile, lockfile = server.lock_profile_cache(str(executable))
+        lockfile.close()
+
+        # flock() locks belong to the open file, so this is like another process
+        with open(profile.with_suffix(".lock"), "w") as other:
+            server.fcntl.flock(other, server.fcntl.LOCK_EX | server.fcntl.LOCK_NB)
+            assert server.lock_profile_cache(str(executable)) == (None, None)
+
+
+def test_lock_profile_cache_no_executable(tmp_path):
+    with mock.patch.dict(os.environ, {"XDG_CACHE_HOME": str(tmp_path)}):
+        assert server.lock_profile_cache(None) == (None, None)
+        missing = str(tmp_path / "missing")
+        assert server.lock_profile_cache(missing) == (None, None)
+    assert not (tmp_path / "unoserver").exists()
+
+
+def test_gzip_request_size_limit():
+    handler = server.XMLRPCRequestHandler.__new__(server.XMLRPCRequestHandler)
+    handler.headers = {"content-encoding": "gzip"}
+    handler.send_response = mock.MagicMock()
+    handler.send_header = mock.MagicMock()
+    handler.end_headers = mock.MagicMock()
+    handler.max_decode_size = 1000
+
+    data = gzip.compress(b"x" * 1000)
+    assert handler.decode_request_content(data) == b"x" * 1000
+    handler.send_response.assert_not_called()
+
+    # A small request must not be able to decompress to any size
+    data = gzip.compress(b"x" * 1001)
+    assert handler.decode_request_content(data) is None
+    handler.send_response.assert_called_once_with(400, "error decoding gzip content")
+
+
+@mock.patch("os.pidfd_open", create=True)
+@mock.patch("socket.create_connection")
+@mock.patch("unoserver.server.spawn")
+def test_server_fails_to_start(spawn_mock, connection_mock, pidfd_mock):
+    # Looking up the filters fails, after the XMLRPC server has been created
+    converter = mock.MagicMock()
+    converter.UnoConverter.return_value.get_available_import_filters.side_effect = (
+        RuntimeError("LibreOffice went away")
+    )
+    comparer = mock.MagicMock()
+    modules = {"unoserver.converter": converter, "unoserver.comparer": comparer}
+    spawn_mock.return_value.poll.return_value = None
+    srv = server.UnoServer(port="0", uno_port="2202")
+    # The package attributes are used too, if the modules have been imported
+    with mock.patch.dict(sys.modules, modules), mock.patch.multiple(
+        "unoserver", create=True, converter=converter, comparer=comparer
+    ):
+        assert srv.start() is None
+    assert srv.xmlrcp_server is None
+    assert not srv.xmlrcp_thread.is_alive()
+
+
+class RunningServer:
+    """An XMLRPCServer with two request threads, serving in a thread"""
+
+    def __init__(self):
+        class TwoThreadServer(server.XMLRPCServer):
+            request_threads = 2
+
+        self.server = TwoThreadServer(("127.0.0.1", 0))
+        self.server.register_function(lambda: "pong", "ping")
+        self.thread = threading.Thread(target=self.server.serve_forever)
+        self.thread.start()
+
+    def proxy(self):
+        host, port = self.server.server_address[:2]
+        return xmlrpc.client.ServerProxy(f"http://{host}:{port}")
+
+    def close(self):
+        self.server.shutdown()
+        self.thread.join()
+        self.server.server_close()
+
+
+def test_idle_connections_dont_block_new_clients():
+    running = RunningServer()
+    try:
+        # Two clients keep their connections open, holding both threads
+        idle = [running.proxy(), running.proxy()]
+        for proxy in idle:
+            assert proxy.ping() == "pong"
+
+        # A new client gets a thread without waiting for them to time out
+        start = time.monotonic()
+        assert running.proxy().ping() == "pong"
+        assert time.monotonic() - start < 2
+
+        # And the clients whose connection was closed reconnect
+        for proxy in idle:
+            assert proxy.ping() == "pong"
+    finally:
+        running.close()
+
+
+def test_server_close_closes_idle_connections():
+    running = RunningServer()
+    proxy = running.proxy()
+    assert proxy.ping() == "pong"
+    running.close()
+    # The request thread is not left waiting for the next request
+    for worker in running.server.request_workers:
+        worker.join(2)
+        assert not worker.is_alive()